@@ -1,6 +1,8 @@
+import os
 import streamlit as st
 from pathlib import Path
 import pandas as pd
+import torch
 from sentence_transformers import SentenceTransformer
 
 # --- Import functions from our src files ---
@@ -45,17 +47,29 @@ with st.expander("Click to see how this system works"):
 
 # --- Cache the models and data ---
 MODEL_NAME = "all-MiniLM-L6-v2"
-DATABASE_PATH = "profiles/multivector_database.pkl" 
+DATABASE_PATH = "profiles/multivector_database.npz" 
 
 @st.cache_resource
 def get_sentence_model():
-    """Loads and caches the SentenceTransformer model."""
-    print("Loading SentenceTransformer model...")
-    return SentenceTransformer(MODEL_NAME)
+    """
+    Loads and caches the SentenceTransformer model on the best available
+    device (fp16 on CUDA, a capped thread count on CPU).
+    """
+    torch.set_num_threads(min(8, os.cpu_count() or 4))
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    print(f"Loading SentenceTransformer model on {device}...")
+    model = SentenceTransformer(MODEL_NAME, device=device)
+    if device == "cuda":
+        model.half()
+    return model
 
-@st.cache_data
+@st.cache_resource
 def get_multivector_database(path):
-    """Loads and caches the multivector database."""
+    """
+    Loads and caches the multivector database.
+    Uses cache_resource so every session shares the same arrays
+    (cache_data would pickle and copy the whole database on each rerun).
+    """
     db_path = Path(path)
     if not db_path.exists():
         st.error(f"Error: Multivector database not found at {path}.")
@@ -64,6 +78,22 @@ def get_multivector_database(path):
     print("Loading multivector database...")
     return load_database(str(db_path))
 
+@st.cache_data(show_spinner=False)
+def encode_query(text):
+    """
+    Embeds a query text, cached on the text itself so changing the
+    sidebar controls doesn't re-run the transformer.
+    """
+    return st_model.encode(text, convert_to_numpy=True, normalize_embeddings=True)
+
+@st.cache_data(show_spinner=False)
+def extract_query_texts(pdf_bytes):
+    """
+    Parses an uploaded PDF straight from memory, cached on its bytes so
+    reruns (e.g. moving the sidebar controls) don't re-parse it.
+    """
+    return extract_multivector_text(pdf_bytes)
+
 # --- Load all models ---
 try:
     st_model = get_sentence_model()
@@ -77,79 +107,66 @@ if database is not None:
     uploaded = st.file_uploader('Upload a PDF research paper', type=['pdf'])
 
     if uploaded:
-        tmp_dir = Path("tmp")
-        tmp_dir.mkdir(exist_ok=True)
-        tmp_path = tmp_dir / uploaded.name
+        with st.spinner('Extracting both "Best Text" and "Full Text" from PDF...'):
+            query_texts = extract_query_texts(uploaded.getvalue())
         
-        try:
-            tmp_path.write_bytes(uploaded.read())
-            
-            with st.spinner('Extracting both "Best Text" and "Full Text" from PDF...'):
-                query_texts = extract_multivector_text(str(tmp_path))
+        # --- Check if we got any valid text ---
+        if not query_texts['best_text'] and not query_texts['full_text']:
+            st.error("Failed to extract any text from this PDF.")
+        else:
             
-            # --- Check if we got any valid text ---
-            if not query_texts['best_text'] and not query_texts['full_text']:
-                st.error("Failed to extract any text from this PDF.")
+            # --- Show a preview of the best text ---
+            if query_texts['best_text']:
+                st.subheader('Extracted Best Text (Abstract/Intro) Preview:')
+                st.info(query_texts['best_text'][:800] + '...')
             else:
+                st.warning("Could not find 'Best Text' (Abstract/Intro). Using Full-Text Fallback only.")
+
+            # --- Sidebar for controls ---
+            st.sidebar.subheader("Controls")
+            top_k = st.sidebar.slider('How many reviewers?', 1, 20, 5)
+            ranking_method = st.sidebar.radio(
+                "Ranking Method",
+                ('max', 'mean'),
+                index=0, # Default to 'max'
+                help="'max' ranks by the best single paper. 'mean' ranks by the author's average."
+            )
+            
+            if st.button(f'Find Top {top_k} Reviewers'):
+                with st.spinner(f'Running dual-search and finding reviewers...'):
+                    
+                    # --- Embed the query texts (skip a side that wasn't found) ---
+                    query_best_vector = encode_query(query_texts['best_text']) if query_texts['best_text'] else None
+                    query_full_vector = encode_query(query_texts['full_text']) if query_texts['full_text'] else None
+
+                    res_df = find_similar_authors(
+                        query_best_vector,
+                        query_full_vector,
+                        st_model,
+                        database, 
+                        top_k=top_k,
+                        ranking_method=ranking_method
+                    )
                 
-                # --- Show a preview of the best text ---
-                if query_texts['best_text']:
-                    st.subheader('Extracted Best Text (Abstract/Intro) Preview:')
-                    st.info(query_texts['best_text'][:800] + '...')
-                else:
-                    st.warning("Could not find 'Best Text' (Abstract/Intro). Using Full-Text Fallback only.")
-
-                # --- Sidebar for controls ---
-                st.sidebar.subheader("Controls")
-                top_k = st.sidebar.slider('How many reviewers?', 1, 20, 5)
-                ranking_method = st.sidebar.radio(
-                    "Ranking Method",
-                    ('max', 'mean'),
-                    index=0, # Default to 'max'
-                    help="'max' ranks by the best single paper. 'mean' ranks by the author's average."
-                )
+                st.subheader('Recommended Reviewers:')
+
+                # --- NEW: EXPLANATION OF THE TABLE ---
+                with st.expander("How to read these results"):
+                    st.markdown("""
+                        * **author**: The name of the recommended reviewer.
+                        * **max**: The **single best score** from one of that author's papers. A high `max` score means the author has at least one *highly relevant* "niche" paper.
+                        * **mean**: The **average score** across *all* of that author's papers. A high `mean` score means the author's *entire research area* is consistently relevant to your topic.
+                        * **count**: The total number of papers by this author in the database.
+                    """)
                 
-                if st.button(f'Find Top {top_k} Reviewers'):
-                    with st.spinner(f'Running dual-search and finding reviewers...'):
-                        
-                        # --- Embed BOTH query texts ---
-                        query_best_vector = st_model.encode(query_texts['best_text'] or "")
-                        query_full_vector = st_model.encode(query_texts['full_text'] or "")
-
-                        res_df = find_similar_authors(
-                            query_best_vector,
-                            query_full_vector,
-                            st_model,
-                            database, 
-                            top_k=top_k
-                        )
-                    
-                    # Sort based on user's choice
-                    res_df = res_df.sort_values(by=ranking_method, ascending=False)
-                    
-                    st.subheader('Recommended Reviewers:')
-
-                    # --- NEW: EXPLANATION OF THE TABLE ---
-                    with st.expander("How to read these results"):
-                        st.markdown("""
-                            * **author**: The name of the recommended reviewer.
-                            * **max**: The **single best score** from one of that author's papers. A high `max` score means the author has at least one *highly relevant* "niche" paper.
-                            * **mean**: The **average score** across *all* of that author's papers. A high `mean` score means the author's *entire research area* is consistently relevant to your topic.
-                            * **count**: The total number of papers by this author in the database.
-                        """)
-                    
-                    res_df_display = res_df.copy()
-                    res_df_display['mean'] = res_df_display['mean'].map('{:,.4f}'.format)
-    
-                    if 'max' in res_df_display.columns:
-                        res_df_display['max'] = res_df_display['max'].map('{:,.4f}'.format)
-                    
-                    # --- NEW: REORDERED COLUMNS ---
-                    cols_to_display = ['author', 'max', 'mean', 'count']
-                    st.dataframe(res_df_display[cols_to_display], use_container_width=True, hide_index=True)
+                res_df_display = res_df.copy()
+                res_df_display['mean'] = res_df_display['mean'].map('{:,.4f}'.format)
 
-        finally:
-            if tmp_path.exists():
-                tmp_path.unlink()
+                if 'max' in res_df_display.columns:
+                    res_df_display['max'] = res_df_display['max'].map('{:,.4f}'.format)
+                
+                # --- NEW: REORDERED COLUMNS ---
+                cols_to_display = ['author', 'max', 'mean', 'count']
+                st.dataframe(res_df_display[cols_to_display], use_container_width=True, hide_index=True)
 else:
     st.warning("Database could not be loaded. Please run 'python -m src.embed' and try again.")
\ No newline at end of file
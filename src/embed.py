@@ -1,5 +1,7 @@
-import pickle
+import os
+import multiprocessing
 import numpy as np
+import torch
 from sentence_transformers import SentenceTransformer
 from pathlib import Path
 from tqdm import tqdm
@@ -12,7 +14,44 @@ except ImportError:
     print("Error: Could not find 'extract_multivector_text' in 'src/parse_pdf.py'")
     exit()
 
-def build_multivector_database(dataset_dir="dataset", out_file="profiles/multivector_database.pkl"):
+def parse_pdf_record(pdf_path):
+    """
+    Parses a single PDF into an (author, paper, texts) tuple.
+    Kept at module level so it can be pickled by multiprocessing.Pool.
+    """
+    pdf_path = Path(pdf_path)
+    author_name = pdf_path.parent.name
+    paper_name = f"{author_name}__{pdf_path.stem}.pdf"
+    return author_name, paper_name, extract_multivector_text(str(pdf_path))
+
+def save_database(out_file, authors, papers, best_mat, full_mat, best_mask, full_mask):
+    """
+    Saves the database as parallel arrays: one (N, dim) float32 matrix per
+    text type, plus the author/paper names and the has-embedding masks.
+    Each paper also gets an integer author id into the sorted 'author_names',
+    and 'order'/'indptr' group the papers by author (CSR-style), so queries
+    can aggregate scores by author with one reduceat per statistic.
+    """
+    author_names, author_ids = np.unique(np.array(authors), return_inverse=True)
+    order = np.argsort(author_ids, kind='stable')
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(author_ids, minlength=len(author_names)))])
+
+    Path(out_file).parent.mkdir(parents=True, exist_ok=True)
+    np.savez(
+        out_file,
+        best=np.ascontiguousarray(best_mat, dtype=np.float32),
+        full=np.ascontiguousarray(full_mat, dtype=np.float32),
+        best_mask=np.asarray(best_mask, dtype=bool),
+        full_mask=np.asarray(full_mask, dtype=bool),
+        authors=np.array(authors),
+        papers=np.array(papers),
+        author_names=author_names,
+        author_ids=author_ids.astype(np.int64),
+        order=order.astype(np.int64),
+        indptr=indptr.astype(np.int64)
+    )
+
+def build_multivector_database(dataset_dir="dataset", out_file="profiles/multivector_database.npz"):
     """
     Creates the new multivector database.
     This will take a long time to run.
@@ -24,52 +63,73 @@ def build_multivector_database(dataset_dir="dataset", out_file="profiles/multive
         print(f"Error: No .pdf files found in {dataset_dir} subfolders.")
         return
 
-    print("Loading Sentence Transformer model...")
-    model = SentenceTransformer("all-MiniLM-L6-v2")
-
-    # This will be a list of dictionaries
-    database_records = []
-    
     print(f"Parsing and embedding {len(pdf_files)} PDFs...")
-    print("This will take 20-30 minutes.")
+    print("This will take a few minutes.")
+
+    # 1. Extract both text types, one PDF per worker process
+    #    (PDF parsing is CPU-bound, so we fan it out across all cores)
+    with multiprocessing.Pool(processes=os.cpu_count()) as pool:
+        parsed = list(tqdm(
+            pool.imap(parse_pdf_record, [str(p) for p in pdf_files], chunksize=4),
+            total=len(pdf_files),
+            desc="Parsing PDFs"
+        ))
+
+    # Load the model only after the pool is closed, so it is not forked into the workers
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    print(f"Loading Sentence Transformer model on {device}...")
+    model = SentenceTransformer("all-MiniLM-L6-v2", device=device)
+    if device == "cuda":
+        # fp16 roughly doubles GPU throughput; embeddings are cast back to float32 below
+        model.half()
+    else:
+        # Cap torch's intra-op threads so they don't oversubscribe the CPU
+        torch.set_num_threads(min(8, os.cpu_count() or 1))
 
-    for pdf_path in tqdm(pdf_files, desc="Processing PDFs"):
-        author_name = pdf_path.parent.name
-        paper_name = f"{author_name}__{pdf_path.stem}.pdf"
-        
-        # 1. Extract both text types
-        texts = extract_multivector_text(str(pdf_path))
+    # 2. Collect every text first, remembering which papers actually have one
+    best_mask = np.array([bool(texts['best_text']) for _, _, texts in parsed], dtype=bool)
+    full_mask = np.array([bool(texts['full_text']) for _, _, texts in parsed], dtype=bool)
+    best_texts = [texts['best_text'] for (_, _, texts), ok in zip(parsed, best_mask) if ok]
+    full_texts = [texts['full_text'] for (_, _, texts), ok in zip(parsed, full_mask) if ok]
 
-        # 2. Embed 'best_text'
-        best_text_embedding = None
-        if texts['best_text']:
-            best_text_embedding = model.encode(texts['best_text'], convert_to_numpy=True)
-            
-        # 3. Embed 'full_text'
-        full_text_embedding = None
-        if texts['full_text']:
-            full_text_embedding = model.encode(texts['full_text'], convert_to_numpy=True)
-        
-        # 4. Add to our database
-        database_records.append({
-            'author': author_name,
-            'paper': paper_name,
-            'best_text_embedding': best_text_embedding,
-            'full_text_embedding': full_text_embedding
-        })
+    # 3. Embed all texts in one batched call. SBERT sorts its inputs by length
+    #    before batching, so a single call over both text types packs batches
+    #    tighter (less padding) than two separate calls
+    print("Embedding 'best_text' and 'full_text'...")
+    all_embeddings = model.encode(
+        best_texts + full_texts, batch_size=64, convert_to_numpy=True,
+        normalize_embeddings=True, show_progress_bar=True
+    )
+    best_embeddings = all_embeddings[:len(best_texts)]
+    full_embeddings = all_embeddings[len(best_texts):]
 
-    print(f"\nCreated {len(database_records)} records.")
+    # 4. Scatter the embeddings into preallocated float32 matrices
+    #    (rows stay zero where the text was missing, so they score 0 at query time)
+    embedding_dim = model.get_sentence_embedding_dimension()
+    best_mat = np.zeros((len(parsed), embedding_dim), dtype=np.float32)
+    full_mat = np.zeros((len(parsed), embedding_dim), dtype=np.float32)
+    if best_mask.any():
+        best_mat[best_mask] = best_embeddings
+    if full_mask.any():
+        full_mat[full_mask] = full_embeddings
+
+    # Re-normalize the rows in float32 (on GPU, SBERT normalized them in fp16),
+    # so queries only need a matmul. Zero rows stay zero.
+    for mat in (best_mat, full_mat):
+        mat /= np.linalg.norm(mat, axis=1, keepdims=True) + 1e-12
+    authors = [author_name for author_name, _, _ in parsed]
+    papers = [paper_name for _, paper_name, _ in parsed]
+
+    print(f"\nCreated {len(papers)} records.")
     
     # 5. Save the final database
-    Path(out_file).parent.mkdir(parents=True, exist_ok=True)
-    with open(out_file, "wb") as f:
-        pickle.dump(database_records, f)
+    save_database(out_file, authors, papers, best_mat, full_mat, best_mask, full_mask)
     
     print(f"\n✅ New 'Multivector Database' saved to {out_file}")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument('--dataset', default='dataset')
-    parser.add_argument('--out', default='profiles/multivector_database.pkl')
+    parser.add_argument('--out', default='profiles/multivector_database.npz')
     args = parser.parse_args()
     build_multivector_database(args.dataset, args.out)
\ No newline at end of file
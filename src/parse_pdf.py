@@ -3,6 +3,24 @@ from pathlib import Path
 from tqdm import tqdm
 import argparse
 import re
+from itertools import islice
+
+# One pattern for every section anchor, so the text is scanned in a single pass.
+# The named group tells us which anchor matched.
+SECTION_RE = re.compile(
+    r'(?P<abstract>(?<!in\s)abstract)'
+    r'|(?P<introduction>introduction)'
+    r'|(?P<abstract_end>keywords|\n1\.)'
+    r'|(?P<intro_end>methods|related work|background|\n2\.)',
+    re.IGNORECASE
+)
+WORD_RE = re.compile(r'\S+')
+
+# Plain-text extraction flags: PyMuPDF's text defaults, which the shipped
+# database was built with (queries must be extracted the same way as the
+# corpus). Image blocks are never needed for embedding, so they are
+# explicitly masked out.
+TEXT_FLAGS = fitz.TEXTFLAGS_TEXT & ~fitz.TEXT_PRESERVE_IMAGES
 
 def clean_full_text(text):
     """
@@ -25,23 +43,70 @@ def clean_full_text(text):
         # No marker found, return the whole text
         return text
 
-def extract_multivector_text(path):
+def first_words(text, start, n):
+    """
+    Returns the first n words of text[start:], without splitting the whole tail.
+    """
+    return " ".join(m.group() for m in islice(WORD_RE.finditer(text, start), n))
+
+def find_section_offsets(full_text):
+    """
+    Finds the start/end offsets of the Abstract and Introduction in one pass.
+    Returns (abstract_start, abstract_end, intro_start, intro_end); any may be None.
+    """
+    abstract_start = abstract_end = intro_start = intro_end = None
+    
+    for match in SECTION_RE.finditer(full_text):
+        kind, pos = match.lastgroup, match.start()
+        
+        # The abstract *ends* at the first intro/keywords/section 1 after it
+        if abstract_start is None:
+            if kind == 'abstract':
+                abstract_start = pos
+        elif abstract_end is None and kind in ('introduction', 'abstract_end'):
+            abstract_end = pos
+        
+        # The intro *ends* at the first methods/related work/section 2 after it
+        if intro_start is None:
+            if kind == 'introduction':
+                intro_start = pos
+        elif intro_end is None and kind == 'intro_end':
+            intro_end = pos
+        
+        if abstract_end is not None and intro_end is not None:
+            break
+    
+    return abstract_start, abstract_end, intro_start, intro_end
+
+def extract_multivector_text(source):
     """
     The main parsing function.
+    'source' is either a path to a PDF or the PDF's raw bytes (e.g. an upload),
+    which are opened in memory without touching the disk.
     Extracts two versions of text from a PDF:
     1. 'best_text': The Abstract + Introduction.
     2. 'full_text': The cleaned full text (no references).
     """
-    full_text = ""
+    is_bytes = isinstance(source, (bytes, bytearray))
+    
+    # Collect the pages in a list and join once (avoids quadratic string +=).
+    # Pages are read sequentially on purpose: PyMuPDF is not thread-safe and
+    # holds the GIL, so a thread pool over one document's pages would risk
+    # corrupting it without any speedup. build_multivector_database
+    # parallelizes across PDFs with one process per PDF instead.
+    parts = []
     try:
-        doc = fitz.open(path)
-        for page in doc:
-            full_text += page.get_text() + "\n"
-        doc.close()
+        doc = fitz.open(stream=source, filetype="pdf") if is_bytes else fitz.open(source)
+        with doc:
+            for page in doc:
+                # sort=False: reading-order sorting isn't needed for embeddings
+                parts.append(page.get_text("text", flags=TEXT_FLAGS, sort=False))
+                parts.append("\n")
     except Exception as e:
-        print(f"Warning: Could not parse {path}. {e}")
+        print(f"Warning: Could not parse {'uploaded PDF' if is_bytes else source}. {e}")
         return {'best_text': None, 'full_text': None}
 
+    full_text = "".join(parts)
     if not full_text.strip():
         return {'best_text': None, 'full_text': None}
 
@@ -51,39 +116,23 @@ def extract_multivector_text(path):
     
     # --- 2. Create the 'best_text' (Abstract + Intro) ---
     best_text = ""
-    full_text_lower = full_text.lower()
+    abstract_start, abstract_end, intro_start, intro_end = find_section_offsets(full_text)
     
     # Try to find "Abstract"
-    abstract_start_match = re.search(r'(?<!in\s)abstract', full_text_lower)
-    
-    if abstract_start_match:
-        abstract_start = abstract_start_match.start()
-        
-        # Find where the abstract *ends* (usually before intro/keywords)
-        abstract_end_match = re.search(r'introduction|keywords|\n1\.', full_text_lower[abstract_start:])
-        
-        if abstract_end_match:
-            abstract_end = abstract_start + abstract_end_match.start()
+    if abstract_start is not None:
+        if abstract_end is not None:
             best_text += full_text[abstract_start:abstract_end]
         else:
             # Couldn't find the end, just take 500 words
-            best_text += " ".join(full_text[abstract_start:].split()[:500])
+            best_text += first_words(full_text, abstract_start, 500)
 
     # Try to find "Introduction" (whether we found abstract or not)
-    intro_start_match = re.search(r'introduction', full_text_lower)
-    
-    if intro_start_match:
-        intro_start = intro_start_match.start()
-        
-        # Find where the intro *ends* (usually before methods/related work/section 2)
-        intro_end_match = re.search(r'methods|related work|background|\n2\.', full_text_lower[intro_start:])
-        
-        if intro_end_match:
-            intro_end = intro_start + intro_end_match.start()
+    if intro_start is not None:
+        if intro_end is not None:
             best_text += "\n" + full_text[intro_start:intro_end]
         else:
             # Couldn't find the end, just take 1000 words
-            best_text += "\n" + " ".join(full_text[intro_start:].split()[:1000])
+            best_text += "\n" + first_words(full_text, intro_start, 1000)
 
     # --- 3. Final Check ---
     # If best_text is still tiny (less than 100 words), it failed. Set to None.
@@ -1,75 +1,101 @@
-import pickle
 import numpy as np
 import pandas as pd
 from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
 from pathlib import Path
 import argparse
 
-def load_database(path="profiles/multivector_database.pkl"):
-    """Loads the pickled multivector database."""
-    with open(path, "rb") as f:
-        data = pickle.load(f)
-    return data
+def load_database(path="profiles/multivector_database.npz"):
+    """
+    Loads the multivector database as a dict of parallel arrays:
+    'best'/'full' (N, dim) embedding matrices, 'best_mask'/'full_mask',
+    'authors' and 'papers', plus the per-paper 'author_ids' into the
+    unique 'author_names' and the 'order'/'indptr' author grouping.
+    Every array is plain numeric/string data, so pickle is never needed.
+    """
+    with np.load(path, allow_pickle=False) as data:
+        database = {name: data[name] for name in data.files}
+    
+    # Make sure the scoring matmuls hit BLAS's contiguous float32 fast path
+    for name in ('best', 'full'):
+        database[name] = np.ascontiguousarray(database[name], dtype=np.float32)
+    return database
 
-def find_similar_authors(query_best_vector, query_full_vector, st_model, database, top_k=5):
+def normalize_query(vector, dtype):
+    """
+    L2-normalizes a query vector in the database matrix dtype.
+    Matching the dtype keeps the matmul from upcasting (and so copying)
+    the whole N x dim matrix when a query arrives as float64.
+    """
+    vector = np.asarray(vector, dtype=dtype)
+    return vector / (np.linalg.norm(vector) + 1e-12)
+
+def find_similar_authors(query_best_vector, query_full_vector, st_model, database, top_k=5, ranking_method='max'):
     """
     Performs the "True Fallback" dual-search.
+    Either query vector may be None (e.g. no Abstract/Intro was found), in
+    which case only the other search is run.
+    Returns the top_k authors ranked by their 'max' or 'mean' paper score.
     """
+    if query_best_vector is None and query_full_vector is None:
+        raise ValueError("At least one of query_best_vector / query_full_vector is required.")
     
-    # Prepare database matrices
-    authors = []
-    papers = []
-    best_text_embeddings = []
-    full_text_embeddings = []
+    # The database matrices are pre-stacked at build time (zero rows for missing texts)
+    db_best_text_matrix = database['best']
+    db_full_text_matrix = database['full']
     
-    embedding_dim = st_model.get_sentence_embedding_dimension()
-    
-    for record in database:
-        authors.append(record['author'])
-        papers.append(record['paper'])
-        
-        # Add embedding or a vector of zeros if it's None
-        if record['best_text_embedding'] is not None:
-            best_text_embeddings.append(record['best_text_embedding'])
-        else:
-            best_text_embeddings.append(np.zeros(embedding_dim))
-            
-        if record['full_text_embedding'] is not None:
-            full_text_embeddings.append(record['full_text_embedding'])
-        else:
-            full_text_embeddings.append(np.zeros(embedding_dim))
-
-    # Convert to numpy matrices for fast computation
-    db_best_text_matrix = np.array(best_text_embeddings)
-    db_full_text_matrix = np.array(full_text_embeddings)
+    # Database rows are L2-normalized at build time, so normalizing the
+    # queries once turns cosine similarity into a plain matrix-vector product.
+    # This is an exact, brute-force search on purpose: the 'mean' and 'count'
+    # columns need every paper's score, which a top-k ANN index (e.g. FAISS)
+    # would not return.
     
     # --- 1. Primary Search (Best vs. Best) ---
-    score_A = cosine_similarity([query_best_vector], db_best_text_matrix).flatten()
+    score_A = None
+    if query_best_vector is not None:
+        score_A = db_best_text_matrix @ normalize_query(query_best_vector, db_best_text_matrix.dtype)
     
     # --- 2. Fallback Search (Full vs. Full) ---
-    score_B = cosine_similarity([query_full_vector], db_full_text_matrix).flatten()
+    score_B = None
+    if query_full_vector is not None:
+        score_B = db_full_text_matrix @ normalize_query(query_full_vector, db_full_text_matrix.dtype)
     
     # --- 3. Get Final Score ---
     # For each paper, take the MAX score from either search
-    final_scores = np.maximum(score_A, score_B)
+    # (or the only search that ran, when one side of the query is missing)
+    if score_A is None:
+        final_scores = score_B
+    elif score_B is None:
+        final_scores = score_A
+    else:
+        final_scores = np.maximum(score_A, score_B, out=score_A)
     
     # --- 4. Aggregate by Author ---
-    df = pd.DataFrame({
-        'author': authors,
-        'paper': papers,
-        'score': final_scores,
-    })
+    # 'order' sorts the papers by author and 'indptr' marks where each
+    # author's run starts (both precomputed at build time), so each
+    # statistic is a single reduceat over contiguous segments
+    author_names = database['author_names']
+    indptr = database['indptr']
+    n_authors = len(author_names)
     
-    author_scores = df.groupby('author')['score'].agg(['mean', 'count']).reset_index()
-    author_max_scores = df.groupby('author')['score'].max().reset_index().rename(columns={'score': 'max'})
-    author_scores = pd.merge(author_scores, author_max_scores, on='author')
+    grouped_scores = final_scores[database['order']]
+    sum_scores = np.add.reduceat(grouped_scores, indptr[:-1], dtype=np.float64)
+    max_scores = np.maximum.reduceat(grouped_scores, indptr[:-1])
+    counts = np.diff(indptr)
+    mean_scores = sum_scores / counts
     
-    # Default sort by 'max'
-    author_scores = author_scores.sort_values(by='max', ascending=False)
-
-    return author_scores.head(top_k)
-
+    # --- 5. Pick the Top K Authors ---
+    # Partial selection is O(A); only the top_k survivors get sorted
+    rank_scores = max_scores if ranking_method == 'max' else mean_scores
+    top_k = min(top_k, n_authors)
+    top_idx = np.argpartition(-rank_scores, top_k - 1)[:top_k]
+    top_idx = top_idx[np.argsort(-rank_scores[top_idx], kind='stable')]
+    
+    return pd.DataFrame({
+        'author': author_names[top_idx],
+        'mean': mean_scores[top_idx],
+        'count': counts[top_idx],
+        'max': max_scores[top_idx],
+    })
 
 # Main execution block for command-line testing
 if __name__ == "__main__":
@@ -81,7 +107,7 @@ if __name__ == "__main__":
     print("Loading model and MULTIVECTOR database...")
     st_model = SentenceTransformer("all-MiniLM-L6-v2")
     
-    db_path = Path("profiles/multivector_database.pkl")
+    db_path = Path("profiles/multivector_database.npz")
     if not db_path.exists():
         print(f"Error: {db_path} not found. Run 'python -m src.embed' first.")
         exit()